@@ -0,0 +1,60 @@
+"""Free duplicate (farm_id, position) pairs before ux_trees_farm_pos is created
+
+Older versions let sync, update and import put several trees on the same
+position, which makes the unique index (and so server startup) fail. For each
+duplicated position the oldest tree keeps it; the others are moved to
+"<position>#<end of id>" so that no data is lost and they can be placed again
+from the app.
+
+    python dedupe_positions.py          # list the duplicates
+    python dedupe_positions.py --apply  # rename them
+"""
+import os
+import sys
+import pymysql
+from dotenv import load_dotenv
+
+load_dotenv()
+
+def main(apply):
+    conn = pymysql.connect(
+        host=os.getenv("MYSQL_HOST", "localhost"),
+        user=os.getenv("MYSQL_USER", "root"),
+        password=os.getenv("MYSQL_PASSWORD", ""),
+        database=os.getenv("MYSQL_DATABASE", "arboria_db"),
+        charset='utf8mb4',
+        cursorclass=pymysql.cursors.DictCursor
+    )
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT farm_id, position FROM trees
+                GROUP BY farm_id, position HAVING COUNT(*) > 1
+            """)
+            duplicates = cursor.fetchall()
+            
+            moved = 0
+            for dup in duplicates:
+                cursor.execute(
+                    "SELECT id FROM trees WHERE farm_id = %s AND position = %s ORDER BY created_at, id",
+                    (dup["farm_id"], dup["position"])
+                )
+                # The oldest tree keeps the position
+                trees = cursor.fetchall()[1:]
+                for tree in trees:
+                    new_position = f"{dup['position']}#{tree['id'][-6:]}"
+                    print(f"Ferme {dup['farm_id']} : arbre {tree['id']} {dup['position']} -> {new_position}")
+                    if apply:
+                        cursor.execute("UPDATE trees SET position = %s WHERE id = %s", (new_position, tree["id"]))
+                    moved += 1
+        
+        if apply:
+            conn.commit()
+            print(f"{moved} arbre(s) déplacé(s)")
+        else:
+            print(f"{moved} arbre(s) à déplacer, relancer avec --apply pour appliquer")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main("--apply" in sys.argv[1:])
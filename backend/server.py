@@ -1,27 +1,43 @@
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from fastapi_cache import FastAPICache
+from fastapi_cache.coder import Coder
+from fastapi_cache.backends.inmemory import InMemoryBackend
+from fastapi_cache.decorator import cache
 from pydantic import BaseModel
+from starlette.datastructures import MutableHeaders
+from slowapi import Limiter
+from slowapi.errors import RateLimitExceeded
+from slowapi.util import get_remote_address
+from cachetools import TTLCache
+from uuid6 import uuid7
 from typing import Optional, List
-from datetime import datetime
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, date, timedelta
+from decimal import Decimal
 import os
+import re
+import asyncio
+import base64
 import hashlib
-import uuid
-import pymysql
-from contextlib import contextmanager
+import hmac
+import logging
+import aiomysql
+import ijson
+import orjson
+from pymysql.constants import ER
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+from contextlib import asynccontextmanager
+from functools import lru_cache
 from dotenv import load_dotenv
 
 load_dotenv()
 
-app = FastAPI(title="ArborIA API")
-
-# CORS configuration
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+logger = logging.getLogger(__name__)
 
 # MySQL connection configuration
 MYSQL_HOST = os.getenv("MYSQL_HOST", "localhost")
@@ -29,28 +45,250 @@ MYSQL_USER = os.getenv("MYSQL_USER", "root")
 MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD", "")
 MYSQL_DATABASE = os.getenv("MYSQL_DATABASE", "arboria_db")
 
-@contextmanager
-def get_db():
-    """Context manager for database connections"""
-    conn = pymysql.connect(
+# Pool tuning: fail fast instead of queueing forever when MySQL is down or saturated
+MYSQL_CONNECT_TIMEOUT = 3
+POOL_ACQUIRE_TIMEOUT = 2
+# Connections per worker; keep workers x MYSQL_POOL_SIZE under MySQL's max_connections (151 by default)
+POOL_MAX_SIZE = int(os.getenv("MYSQL_POOL_SIZE", "32"))
+POOL_MIN_SIZE = min(4, POOL_MAX_SIZE)
+
+# Response cache configuration (Redis when REDIS_URL is set, in-process otherwise)
+REDIS_URL = os.getenv("REDIS_URL")
+# Worker count as passed to uvicorn/gunicorn; in-process caches are only safe with one
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+CACHE_TTL = 300
+ALL_CACHE_NAMESPACES = ("farms", "trees", "interventions", "statistics")
+
+# Login throttling and short-lived phone -> credentials cache for the auth hot path
+LOGIN_RATE_LIMIT = "5/minute"
+AUTH_CACHE_TTL = 30
+auth_cache = TTLCache(maxsize=10_000, ttl=AUTH_CACHE_TTL)
+
+# Argon2 runs in worker processes; the cap bounds its CPU and memory (46 MiB per hash)
+HASH_WORKERS = min(os.cpu_count() or 1, 4)
+
+# Indexes backing the hot lookups: (table, index name, columns, kind)
+INDEXES = [
+    ("users", "ux_users_phone", ("phone",), "UNIQUE"),
+    ("trees", "ux_trees_farm_pos", ("farm_id", "position"), "UNIQUE"),
+    ("interventions", "ix_interventions_tree_date", ("tree_id", "date"), None),
+    ("tree_photos", "ix_tree_photos_tree_created", ("tree_id", "created_at"), None),
+    # Unfiltered listings sorted by recency
+    ("farms", "ix_farms_created", ("created_at",), None),
+    ("trees", "ix_trees_created", ("created_at",), None),
+    ("interventions", "ix_interventions_date", ("date",), None),
+    # Free-text search
+    ("trees", "ft_trees_search", ("species", "variety", "position", "notes"), "FULLTEXT"),
+]
+
+# Shortest word InnoDB puts in a FULLTEXT index (innodb_ft_min_token_size)
+FULLTEXT_MIN_TOKEN = 3
+
+# Minimum VARCHAR widths required by the application: (table, column, length)
+COLUMN_WIDTHS = [
+    ("users", "password_hash", 255),
+]
+
+def orjson_default(value):
+    # DECIMAL columns come back as Decimal, which orjson does not serialize natively
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError
+
+def dumps_json(value):
+    """orjson.dumps with the same coverage as ORJSONResponse (NULL/int keys from GROUP BY dicts)"""
+    return orjson.dumps(value, default=orjson_default, option=orjson.OPT_NON_STR_KEYS)
+
+class ORJSONCoder(Coder):
+    """Cache payloads as orjson bytes so hits and misses render identically"""
+    
+    @classmethod
+    def encode(cls, value):
+        return dumps_json(value)
+    
+    @classmethod
+    def decode(cls, value):
+        return orjson.loads(value)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the MySQL connection pool on startup and close it on shutdown"""
+    app.state.pool = await aiomysql.create_pool(
         host=MYSQL_HOST,
         user=MYSQL_USER,
         password=MYSQL_PASSWORD,
-        database=MYSQL_DATABASE,
+        db=MYSQL_DATABASE,
         charset='utf8mb4',
-        cursorclass=pymysql.cursors.DictCursor
+        cursorclass=aiomysql.DictCursor,
+        # Each get_db() block is one transaction, committed once at the end
+        autocommit=False,
+        connect_timeout=MYSQL_CONNECT_TIMEOUT,
+        minsize=POOL_MIN_SIZE,
+        maxsize=POOL_MAX_SIZE,
+        pool_recycle=300
     )
+    if REDIS_URL:
+        from fastapi_cache.backends.redis import RedisBackend
+        from redis import asyncio as aioredis
+        FastAPICache.init(RedisBackend(aioredis.from_url(REDIS_URL)), prefix="arboria", expire=CACHE_TTL, coder=ORJSONCoder)
+    else:
+        # Each worker would only invalidate its own cache and count its own login attempts
+        if WEB_CONCURRENCY > 1:
+            raise RuntimeError("REDIS_URL est requis quand WEB_CONCURRENCY > 1")
+        logger.warning("REDIS_URL non défini : cache et limite de connexion en mémoire, "
+                       "valables seulement avec un unique worker")
+        FastAPICache.init(InMemoryBackend(), prefix="arboria", expire=CACHE_TTL, coder=ORJSONCoder)
+    app.state.hash_executor = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+    await ensure_indexes()
+    await ensure_column_widths()
+    try:
+        yield
+    finally:
+        app.state.hash_executor.shutdown(wait=False, cancel_futures=True)
+        app.state.pool.close()
+        await app.state.pool.wait_closed()
+
+app = FastAPI(title="ArborIA API", lifespan=lifespan, default_response_class=ORJSONResponse)
+
+# Shares Redis with the response cache when available so limits hold across workers
+limiter = Limiter(key_func=get_remote_address, storage_uri=REDIS_URL or "memory://")
+app.state.limiter = limiter
+
+# CORS configuration
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# Compress JSON lists and exports; small payloads are not worth the CPU
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
+class ServerSideCacheOnly:
+    """Replace the max-age fastapi-cache sets on cached responses with no-cache
+
+    Otherwise clients would keep showing lists that a write has already
+    invalidated on the server. Plain ASGI rather than @app.middleware("http"),
+    which would wrap the streamed import body and export responses.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        
+        async def send_with_cache_control(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                if FastAPICache.get_cache_status_header() in headers:
+                    headers["Cache-Control"] = "no-cache"
+            await send(message)
+        
+        await self.app(scope, receive, send_with_cache_control)
+
+app.add_middleware(ServerSideCacheOnly)
+
+@app.exception_handler(aiomysql.MySQLError)
+async def database_error_handler(request: Request, exc: aiomysql.MySQLError):
+    # Lost or refused connections are transient; anything else is a server bug
+    logger.exception("Erreur MySQL sur %s %s", request.method, request.url.path, exc_info=exc)
+    if isinstance(exc, aiomysql.OperationalError):
+        return ORJSONResponse(status_code=503, content={"detail": "Base de données indisponible, réessayez plus tard"})
+    return ORJSONResponse(status_code=500, content={"detail": "Erreur de base de données"})
+
+@app.exception_handler(RateLimitExceeded)
+async def rate_limit_handler(request: Request, exc: RateLimitExceeded):
+    return ORJSONResponse(status_code=429, content={"detail": "Trop de tentatives, réessayez plus tard"})
+
+async def acquire_db():
+    """Take a connection from the pool, or fail with 503 when none frees up in time"""
+    try:
+        return await asyncio.wait_for(app.state.pool.acquire(), timeout=POOL_ACQUIRE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Base de données indisponible, réessayez plus tard")
+
+@asynccontextmanager
+async def get_db(invalidates=(), conn=None):
+    """Context manager for pooled database connections
+
+    ``conn`` takes over a connection already obtained from acquire_db(), for
+    streaming responses that must fail before their headers are sent. Cached
+    responses in the ``invalidates`` namespaces are dropped once the
+    transaction has been committed.
+    """
+    if conn is None:
+        conn = await acquire_db()
     try:
         yield conn
-        conn.commit()
+        await conn.commit()
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         raise e
     finally:
-        conn.close()
+        app.state.pool.release(conn)
+    for namespace in invalidates:
+        await FastAPICache.clear(namespace=namespace)
+
+# Which existing indexes satisfy an INDEXES entry of each kind
+INDEX_KIND_MATCH = {
+    "UNIQUE": "NON_UNIQUE = 0 AND INDEX_TYPE <> 'FULLTEXT'",
+    "FULLTEXT": "INDEX_TYPE = 'FULLTEXT'",
+    None: "INDEX_TYPE <> 'FULLTEXT'",
+}
+
+async def ensure_indexes():
+    """Create any index from INDEXES not already covered by an index of the same kind
+
+    Startup fails if a UNIQUE index cannot be created: the write handlers rely
+    on those constraints instead of checking for duplicates themselves.
+    """
+    async with get_db() as conn:
+        cursor = await conn.cursor()
+        for table, name, columns, kind in INDEXES:
+            await cursor.execute(f"""
+                SELECT INDEX_NAME FROM information_schema.STATISTICS
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND {INDEX_KIND_MATCH[kind]}
+                GROUP BY INDEX_NAME
+                HAVING GROUP_CONCAT(COLUMN_NAME ORDER BY SEQ_IN_INDEX) = %s
+            """, (table, ",".join(columns)))
+            if await cursor.fetchone():
+                continue
+            try:
+                await cursor.execute(
+                    f"CREATE {kind + ' ' if kind else ''}INDEX {name} ON {table} ({', '.join(columns)})"
+                )
+            except aiomysql.IntegrityError:
+                logger.error("Index %s sur %s non créé : doublons existants à corriger "
+                             "(voir backend/dedupe_positions.py)", name, table)
+                raise
+            except aiomysql.OperationalError as e:
+                # Another worker starting at the same time created it first
+                if e.args[0] != ER.DUP_KEYNAME:
+                    raise
+
+async def ensure_column_widths():
+    """Widen any VARCHAR column from COLUMN_WIDTHS that is too narrow"""
+    async with get_db() as conn:
+        cursor = await conn.cursor()
+        for table, column, length in COLUMN_WIDTHS:
+            await cursor.execute("""
+                SELECT CHARACTER_MAXIMUM_LENGTH AS length, IS_NULLABLE AS nullable
+                FROM information_schema.COLUMNS
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+            """, (table, column))
+            current = await cursor.fetchone()
+            if not current or current["length"] >= length:
+                continue
+            not_null = " NOT NULL" if current["nullable"] == "NO" else ""
+            await cursor.execute(f"ALTER TABLE {table} MODIFY {column} VARCHAR({length}){not_null}")
 
 def generate_id():
-    return str(uuid.uuid4())
+    # Time-ordered ids keep primary key inserts appending to the B-tree
+    return str(uuid7())
 
 # Pydantic Models
 class GPSCoords(BaseModel):
@@ -115,34 +353,107 @@ class DuplicateTree(BaseModel):
     target_position: str
     target_farm_id: Optional[str] = None
 
+class TreeSyncItem(BaseModel):
+    id: Optional[str] = None
+    farm_id: str
+    position: str
+    species: str
+    variety: Optional[str] = None
+    plant_date: Optional[str] = None
+    health: str = "good"
+    notes: Optional[str] = None
+
 class SyncBatch(BaseModel):
-    trees: List[dict]
+    trees: List[TreeSyncItem]
+
+def like_pattern(value: str) -> str:
+    """Build a LIKE substring pattern matching ``value`` literally"""
+    escaped = value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+def fulltext_query(value: str) -> Optional[str]:
+    """Boolean-mode query requiring every word of ``value`` as a prefix
+
+    Returns None when a word is too short to be in the FULLTEXT index, in
+    which case callers fall back to LIKE.
+    """
+    words = re.findall(r"\w+", value)
+    if not words or any(len(word) < FULLTEXT_MIN_TOKEN for word in words):
+        return None
+    return " ".join(f"+{word}*" for word in words)
+
+@lru_cache(maxsize=None)
+def update_sql(table: str, columns: tuple) -> str:
+    """UPDATE template for one combination of columns, built once"""
+    assignments = ", ".join(f"{column} = %s" for column in columns)
+    return f"UPDATE {table} SET {assignments}, updated_at = %s WHERE id = %s"
+
+def build_update(table: str, update_model: BaseModel, record_id: str):
+    """UPDATE statement and values for the fields provided in a partial update model
+
+    Returns ``(None, None)`` when no field was provided.
+    """
+    fields = update_model.model_dump(exclude_unset=True, exclude_none=True)
+    gps = fields.pop("gps_coords", None)
+    columns = list(fields)
+    values = list(fields.values())
+    if gps is not None:
+        columns += ["gps_latitude", "gps_longitude"]
+        values += [gps["latitude"], gps["longitude"]]
+    if not columns:
+        return None, None
+    return update_sql(table, tuple(columns)), values + [datetime.utcnow(), record_id]
 
-def hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode()).hexdigest()
+# Argon2id with the OWASP-recommended cost (46 MiB, 2 passes, 1 lane)
+password_hasher = PasswordHasher(time_cost=2, memory_cost=46 * 1024, parallelism=1)
+
+async def run_hasher(func, *args):
+    # Argon2 is deliberately expensive: keep it off the event loop and the threadpool
+    return await asyncio.get_running_loop().run_in_executor(app.state.hash_executor, func, *args)
+
+async def hash_password(password: str) -> str:
+    return await run_hasher(password_hasher.hash, password)
+
+async def verify_password(password_hash: str, password: str) -> bool:
+    if len(password_hash) == 64:
+        # Accounts created before Argon2 still hold an unsalted SHA-256 hex digest
+        return hmac.compare_digest(password_hash, hashlib.sha256(password.encode()).hexdigest())
+    try:
+        return await run_hasher(password_hasher.verify, password_hash, password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+def password_needs_rehash(password_hash: str) -> bool:
+    # Legacy SHA-256 digests and Argon2 hashes made with older parameters
+    return len(password_hash) == 64 or password_hasher.check_needs_rehash(password_hash)
 
 # Root endpoint
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "ArborIA API - Gestion Arboricole (MySQL)", "version": "2.1.0"}
 
 # ============== AUTH ENDPOINTS ==============
 
 @app.post("/api/auth/register")
-def register_user(user: UserRegister):
-    with get_db() as conn:
-        cursor = conn.cursor()
-        
-        # Check if user exists
-        cursor.execute("SELECT id FROM users WHERE phone = %s", (user.phone,))
-        if cursor.fetchone():
-            raise HTTPException(status_code=400, detail="Ce numéro de téléphone est déjà utilisé")
+async def register_user(user: UserRegister):
+    # Hashed before taking a connection: queued behind the Argon2 workers, it
+    # would otherwise hold a pool slot that other endpoints need
+    password_hash = await hash_password(user.password)
+    
+    async with get_db() as conn:
+        cursor = await conn.cursor()
         
         user_id = generate_id()
-        cursor.execute(
-            "INSERT INTO users (id, phone, password_hash) VALUES (%s, %s, %s)",
-            (user_id, user.phone, hash_password(user.password))
-        )
+        try:
+            await cursor.execute(
+                "INSERT INTO users (id, phone, password_hash) VALUES (%s, %s, %s)",
+                (user_id, user.phone, password_hash)
+            )
+        except aiomysql.IntegrityError as e:
+            # ux_users_phone rejects phone numbers that are already registered
+            if e.args[0] != ER.DUP_ENTRY:
+                raise
+            raise HTTPException(status_code=400, detail="Ce numéro de téléphone est déjà utilisé")
         
         return {
             "id": user_id,
@@ -151,51 +462,72 @@ def register_user(user: UserRegister):
         }
 
 @app.post("/api/auth/login")
-def login_user(user: UserLogin):
-    with get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, phone, password_hash FROM users WHERE phone = %s", (user.phone,))
-        db_user = cursor.fetchone()
-        
-        if not db_user or db_user["password_hash"] != hash_password(user.password):
-            raise HTTPException(status_code=401, detail="Numéro de téléphone ou mot de passe incorrect")
-        
-        return {
-            "id": db_user["id"],
-            "phone": db_user["phone"],
-            "message": "Connexion réussie"
-        }
+@limiter.limit(LOGIN_RATE_LIMIT)
+async def login_user(request: Request, user: UserLogin):
+    db_user = auth_cache.get(user.phone)
+    if db_user is None:
+        async with get_db() as conn:
+            cursor = await conn.cursor()
+            await cursor.execute("SELECT id, phone, password_hash FROM users WHERE phone = %s", (user.phone,))
+            db_user = await cursor.fetchone()
+    
+    if not db_user or not await verify_password(db_user["password_hash"], user.password):
+        raise HTTPException(status_code=401, detail="Numéro de téléphone ou mot de passe incorrect")
+    
+    if password_needs_rehash(db_user["password_hash"]):
+        db_user = {**db_user, "password_hash": await hash_password(user.password)}
+        async with get_db() as conn:
+            cursor = await conn.cursor()
+            await cursor.execute(
+                "UPDATE users SET password_hash = %s WHERE id = %s",
+                (db_user["password_hash"], db_user["id"])
+            )
+    
+    auth_cache[user.phone] = db_user
+    
+    return {
+        "id": db_user["id"],
+        "phone": db_user["phone"],
+        "message": "Connexion réussie"
+    }
+
+# The demo account never changes once created, so its id is kept in-process
+demo_user_id = None
 
 @app.get("/api/auth/demo")
-def demo_login():
-    with get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, phone FROM users WHERE phone = 'demo'")
-        demo_user = cursor.fetchone()
-        
-        if not demo_user:
-            user_id = generate_id()
-            cursor.execute(
-                "INSERT INTO users (id, phone, password_hash, is_demo) VALUES (%s, 'demo', %s, TRUE)",
-                (user_id, hash_password("demo123"))
-            )
-            return {"id": user_id, "phone": "demo", "is_demo": True, "message": "Connexion démo réussie"}
-        
-        return {"id": demo_user["id"], "phone": "demo", "is_demo": True, "message": "Connexion démo réussie"}
+async def demo_login():
+    global demo_user_id
+    if demo_user_id is None:
+        async with get_db() as conn:
+            cursor = await conn.cursor()
+            await cursor.execute("SELECT id, phone FROM users WHERE phone = 'demo'")
+            demo_user = await cursor.fetchone()
+            
+            if demo_user:
+                user_id = demo_user["id"]
+            else:
+                user_id = generate_id()
+                await cursor.execute(
+                    "INSERT INTO users (id, phone, password_hash, is_demo) VALUES (%s, 'demo', %s, TRUE)",
+                    (user_id, await hash_password("demo123"))
+                )
+        demo_user_id = user_id
+    
+    return {"id": demo_user_id, "phone": "demo", "is_demo": True, "message": "Connexion démo réussie"}
 
 # ============== FARM ENDPOINTS ==============
 
 @app.post("/api/farms")
-def create_farm(farm: Farm):
-    with get_db() as conn:
-        cursor = conn.cursor()
+async def create_farm(farm: Farm):
+    async with get_db(invalidates=("farms",)) as conn:
+        cursor = await conn.cursor()
         farm_id = generate_id()
         now = datetime.utcnow()
         
         gps_lat = farm.gps_coords.latitude if farm.gps_coords else None
         gps_lng = farm.gps_coords.longitude if farm.gps_coords else None
         
-        cursor.execute("""
+        await cursor.execute("""
             INSERT INTO farms (id, name, description, grid_rows, grid_cols, gps_latitude, gps_longitude, created_at, updated_at)
             VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
         """, (farm_id, farm.name, farm.description, farm.grid_rows, farm.grid_cols, gps_lat, gps_lng, now, now))
@@ -206,18 +538,21 @@ def create_farm(farm: Farm):
             "description": farm.description,
             "grid_rows": farm.grid_rows,
             "grid_cols": farm.grid_cols,
-            "gps_coords": farm.gps_coords.dict() if farm.gps_coords else None,
-            "created_at": now.isoformat(),
-            "updated_at": now.isoformat(),
+            "gps_coords": farm.gps_coords.model_dump() if farm.gps_coords else None,
+            "created_at": now,
+            "updated_at": now,
             "message": "Ferme créée avec succès"
         }
 
+FARM_COLUMNS = "id, name, description, grid_rows, grid_cols, gps_latitude, gps_longitude, created_at, updated_at"
+
 @app.get("/api/farms")
-def get_farms():
-    with get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM farms ORDER BY created_at DESC")
-        farms = cursor.fetchall()
+@cache(namespace="farms")
+async def get_farms():
+    async with get_db() as conn:
+        cursor = await conn.cursor()
+        await cursor.execute(f"SELECT {FARM_COLUMNS} FROM farms ORDER BY created_at DESC")
+        farms = await cursor.fetchall()
         
         result = []
         for farm in farms:
@@ -232,104 +567,71 @@ def get_farms():
                 "grid_rows": farm["grid_rows"],
                 "grid_cols": farm["grid_cols"],
                 "gps_coords": gps_coords,
-                "created_at": farm["created_at"].isoformat() if farm["created_at"] else None,
-                "updated_at": farm["updated_at"].isoformat() if farm["updated_at"] else None
+                "created_at": farm["created_at"],
+                "updated_at": farm["updated_at"]
             })
         
         return result
 
+async def fetch_farm(cursor, farm_id):
+    await cursor.execute(f"SELECT {FARM_COLUMNS} FROM farms WHERE id = %s", (farm_id,))
+    farm = await cursor.fetchone()
+    
+    if not farm:
+        raise HTTPException(status_code=404, detail="Ferme non trouvée")
+    
+    gps_coords = None
+    if farm["gps_latitude"] and farm["gps_longitude"]:
+        gps_coords = {"latitude": farm["gps_latitude"], "longitude": farm["gps_longitude"]}
+    
+    return {
+        "id": farm["id"],
+        "name": farm["name"],
+        "description": farm["description"],
+        "grid_rows": farm["grid_rows"],
+        "grid_cols": farm["grid_cols"],
+        "gps_coords": gps_coords,
+        "created_at": farm["created_at"],
+        "updated_at": farm["updated_at"]
+    }
+
 @app.get("/api/farms/{farm_id}")
-def get_farm(farm_id: str):
-    with get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM farms WHERE id = %s", (farm_id,))
-        farm = cursor.fetchone()
-        
-        if not farm:
-            raise HTTPException(status_code=404, detail="Ferme non trouvée")
-        
-        gps_coords = None
-        if farm["gps_latitude"] and farm["gps_longitude"]:
-            gps_coords = {"latitude": farm["gps_latitude"], "longitude": farm["gps_longitude"]}
-        
-        return {
-            "id": farm["id"],
-            "name": farm["name"],
-            "description": farm["description"],
-            "grid_rows": farm["grid_rows"],
-            "grid_cols": farm["grid_cols"],
-            "gps_coords": gps_coords,
-            "created_at": farm["created_at"].isoformat() if farm["created_at"] else None,
-            "updated_at": farm["updated_at"].isoformat() if farm["updated_at"] else None
-        }
+@cache(namespace="farms")
+async def get_farm(farm_id: str):
+    async with get_db() as conn:
+        cursor = await conn.cursor()
+        return await fetch_farm(cursor, farm_id)
 
 @app.put("/api/farms/{farm_id}")
-def update_farm(farm_id: str, farm_update: FarmUpdate):
-    with get_db() as conn:
-        cursor = conn.cursor()
+async def update_farm(farm_id: str, farm_update: FarmUpdate):
+    async with get_db(invalidates=("farms",)) as conn:
+        cursor = await conn.cursor()
         
-        cursor.execute("SELECT id FROM farms WHERE id = %s", (farm_id,))
-        if not cursor.fetchone():
-            raise HTTPException(status_code=404, detail="Ferme non trouvée")
-        
-        updates = []
-        values = []
-        
-        if farm_update.name is not None:
-            updates.append("name = %s")
-            values.append(farm_update.name)
-        if farm_update.description is not None:
-            updates.append("description = %s")
-            values.append(farm_update.description)
-        if farm_update.grid_rows is not None:
-            updates.append("grid_rows = %s")
-            values.append(farm_update.grid_rows)
-        if farm_update.grid_cols is not None:
-            updates.append("grid_cols = %s")
-            values.append(farm_update.grid_cols)
-        if farm_update.gps_coords is not None:
-            updates.append("gps_latitude = %s")
-            updates.append("gps_longitude = %s")
-            values.append(farm_update.gps_coords.latitude)
-            values.append(farm_update.gps_coords.longitude)
-        
-        if updates:
-            updates.append("updated_at = %s")
-            values.append(datetime.utcnow())
-            values.append(farm_id)
-            
-            cursor.execute(f"UPDATE farms SET {', '.join(updates)} WHERE id = %s", values)
+        sql, values = build_update("farms", farm_update, farm_id)
+        if sql:
+            await cursor.execute(sql, values)
         
-        return get_farm(farm_id)
+        # Read back in the same transaction; a missing farm 404s here
+        return await fetch_farm(cursor, farm_id)
 
 @app.delete("/api/farms/{farm_id}")
-def delete_farm(farm_id: str):
-    with get_db() as conn:
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT id FROM farms WHERE id = %s", (farm_id,))
-        if not cursor.fetchone():
-            raise HTTPException(status_code=404, detail="Ferme non trouvée")
+async def delete_farm(farm_id: str):
+    async with get_db(invalidates=ALL_CACHE_NAMESPACES) as conn:
+        cursor = await conn.cursor()
         
         # Les arbres et interventions sont supprimés automatiquement via CASCADE
-        cursor.execute("DELETE FROM farms WHERE id = %s", (farm_id,))
+        await cursor.execute("DELETE FROM farms WHERE id = %s", (farm_id,))
+        if cursor.rowcount == 0:
+            raise HTTPException(status_code=404, detail="Ferme non trouvée")
         
         return {"message": "Ferme et arbres associés supprimés avec succès", "success": True}
 
 # ============== TREE ENDPOINTS ==============
 
 @app.post("/api/trees")
-def create_tree(tree: Tree):
-    with get_db() as conn:
-        cursor = conn.cursor()
-        
-        # Check if position exists
-        cursor.execute(
-            "SELECT id FROM trees WHERE farm_id = %s AND position = %s",
-            (tree.farm_id, tree.position)
-        )
-        if cursor.fetchone():
-            raise HTTPException(status_code=400, detail=f"Un arbre existe déjà à la position {tree.position}")
+async def create_tree(tree: Tree):
+    async with get_db(invalidates=("trees", "statistics")) as conn:
+        cursor = await conn.cursor()
         
         tree_id = generate_id()
         now = datetime.utcnow()
@@ -337,17 +639,23 @@ def create_tree(tree: Tree):
         gps_lat = tree.gps_coords.latitude if tree.gps_coords else None
         gps_lng = tree.gps_coords.longitude if tree.gps_coords else None
         
-        cursor.execute("""
-            INSERT INTO trees (id, farm_id, position, species, variety, plant_date, health, notes, photo, origin, gps_latitude, gps_longitude, synced, created_at, updated_at)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """, (tree_id, tree.farm_id, tree.position, tree.species, tree.variety, tree.plant_date, tree.health, tree.notes, tree.photo, tree.origin, gps_lat, gps_lng, tree.synced, now, now))
+        # The unique (farm_id, position) index rejects occupied positions
+        try:
+            await cursor.execute("""
+                INSERT INTO trees (id, farm_id, position, species, variety, plant_date, health, notes, photo, origin, gps_latitude, gps_longitude, synced, created_at, updated_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, (tree_id, tree.farm_id, tree.position, tree.species, tree.variety, tree.plant_date, tree.health, tree.notes, tree.photo, tree.origin, gps_lat, gps_lng, tree.synced, now, now))
+        except aiomysql.IntegrityError as e:
+            if e.args[0] != ER.DUP_ENTRY:
+                raise
+            raise HTTPException(status_code=400, detail=f"Un arbre existe déjà à la position {tree.position}")
         
         # Add photo to tree_photos if provided
         if tree.photo:
             photo_id = generate_id()
-            cursor.execute(
-                "INSERT INTO tree_photos (id, tree_id, photo) VALUES (%s, %s, %s)",
-                (photo_id, tree_id, tree.photo)
+            await cursor.execute(
+                "INSERT INTO tree_photos (id, tree_id, photo, created_at) VALUES (%s, %s, %s, %s)",
+                (photo_id, tree_id, tree.photo, now)
             )
         
         return {
@@ -361,175 +669,164 @@ def create_tree(tree: Tree):
             "notes": tree.notes,
             "photo": tree.photo,
             "photos": [tree.photo] if tree.photo else [],
+            "photo_ids": [photo_id] if tree.photo else [],
             "origin": tree.origin,
-            "gps_coords": tree.gps_coords.dict() if tree.gps_coords else None,
+            "gps_coords": tree.gps_coords.model_dump() if tree.gps_coords else None,
             "synced": tree.synced,
-            "created_at": now.isoformat(),
-            "updated_at": now.isoformat(),
+            "created_at": now,
+            "updated_at": now,
             "message": "Arbre créé avec succès"
         }
 
-def format_tree(tree, photos=None):
+# Columns needed by tree list views: no notes and no photo payloads
+TREE_LIST_COLUMNS = "id, farm_id, position, species, variety, plant_date, health, origin, gps_latitude, gps_longitude, synced, created_at, updated_at"
+TREE_COLUMNS = f"{TREE_LIST_COLUMNS}, notes, photo"
+
+def format_tree_summary(tree, photo_ids=None):
     gps_coords = None
     if tree.get("gps_latitude") and tree.get("gps_longitude"):
         gps_coords = {"latitude": tree["gps_latitude"], "longitude": tree["gps_longitude"]}
     
-    plant_date = tree.get("plant_date")
-    if plant_date and hasattr(plant_date, 'isoformat'):
-        plant_date = plant_date.isoformat()
-    
     return {
         "id": tree["id"],
         "farm_id": tree["farm_id"],
         "position": tree["position"],
         "species": tree["species"],
         "variety": tree.get("variety"),
-        "plant_date": str(plant_date) if plant_date else None,
+        "plant_date": tree.get("plant_date") or None,
         "health": tree["health"],
-        "notes": tree.get("notes"),
-        "photo": tree.get("photo"),
-        "photos": photos or [],
+        "photo_ids": photo_ids or [],
         "origin": tree.get("origin"),
         "gps_coords": gps_coords,
         "synced": bool(tree.get("synced", True)),
-        "created_at": tree["created_at"].isoformat() if tree.get("created_at") else None,
-        "updated_at": tree["updated_at"].isoformat() if tree.get("updated_at") else None
+        "created_at": tree.get("created_at"),
+        "updated_at": tree.get("updated_at")
     }
 
+def format_tree(tree, photos=None):
+    photos = photos or []
+    result = format_tree_summary(tree, [p["id"] for p in photos])
+    result["notes"] = tree.get("notes")
+    result["photo"] = tree.get("photo")
+    result["photos"] = [p["photo"] for p in photos]
+    return result
+
+async def fetch_photo_ids(cursor, trees):
+    """Photo ids of all given trees in one query, keyed by tree id"""
+    photo_ids = defaultdict(list)
+    if not trees:
+        return photo_ids
+    
+    ids = [tree["id"] for tree in trees]
+    await cursor.execute(
+        f"SELECT id, tree_id FROM tree_photos WHERE tree_id IN ({', '.join(['%s'] * len(ids))}) ORDER BY created_at",
+        ids
+    )
+    for photo in await cursor.fetchall():
+        photo_ids[photo["tree_id"]].append(photo["id"])
+    return photo_ids
+
 @app.get("/api/trees")
-def get_trees(farm_id: Optional[str] = None):
-    with get_db() as conn:
-        cursor = conn.cursor()
+@cache(namespace="trees")
+async def get_trees(farm_id: Optional[str] = None):
+    async with get_db() as conn:
+        cursor = await conn.cursor()
         
         if farm_id:
-            cursor.execute("SELECT * FROM trees WHERE farm_id = %s ORDER BY position", (farm_id,))
+            await cursor.execute(f"SELECT {TREE_LIST_COLUMNS} FROM trees WHERE farm_id = %s ORDER BY position", (farm_id,))
         else:
-            cursor.execute("SELECT * FROM trees ORDER BY created_at DESC")
+            await cursor.execute(f"SELECT {TREE_LIST_COLUMNS} FROM trees ORDER BY created_at DESC")
         
-        trees = cursor.fetchall()
-        
-        result = []
-        for tree in trees:
-            cursor.execute("SELECT photo FROM tree_photos WHERE tree_id = %s", (tree["id"],))
-            photos = [p["photo"] for p in cursor.fetchall()]
-            result.append(format_tree(tree, photos))
+        trees = await cursor.fetchall()
         
-        return result
+        photo_ids = await fetch_photo_ids(cursor, trees)
+        return [format_tree_summary(tree, photo_ids[tree["id"]]) for tree in trees]
+
+async def fetch_tree(cursor, tree_id):
+    await cursor.execute(f"SELECT {TREE_COLUMNS} FROM trees WHERE id = %s", (tree_id,))
+    tree = await cursor.fetchone()
+    
+    if not tree:
+        raise HTTPException(status_code=404, detail="Arbre non trouvé")
+    
+    await cursor.execute("SELECT id, photo FROM tree_photos WHERE tree_id = %s ORDER BY created_at", (tree_id,))
+    
+    return format_tree(tree, await cursor.fetchall())
 
 @app.get("/api/trees/{tree_id}")
-def get_tree(tree_id: str):
-    with get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM trees WHERE id = %s", (tree_id,))
-        tree = cursor.fetchone()
-        
-        if not tree:
-            raise HTTPException(status_code=404, detail="Arbre non trouvé")
-        
-        cursor.execute("SELECT photo FROM tree_photos WHERE tree_id = %s", (tree_id,))
-        photos = [p["photo"] for p in cursor.fetchall()]
-        
-        return format_tree(tree, photos)
+async def get_tree(tree_id: str):
+    async with get_db() as conn:
+        cursor = await conn.cursor()
+        return await fetch_tree(cursor, tree_id)
 
 @app.put("/api/trees/{tree_id}")
-def update_tree(tree_id: str, tree_update: TreeUpdate):
-    with get_db() as conn:
-        cursor = conn.cursor()
+async def update_tree(tree_id: str, tree_update: TreeUpdate):
+    async with get_db(invalidates=("trees", "statistics")) as conn:
+        cursor = await conn.cursor()
         
-        cursor.execute("SELECT id FROM trees WHERE id = %s", (tree_id,))
-        if not cursor.fetchone():
+        sql, values = build_update("trees", tree_update, tree_id)
+        if sql:
+            try:
+                await cursor.execute(sql, values)
+            except aiomysql.IntegrityError as e:
+                # ux_trees_farm_pos: the new position is taken by another tree of the farm
+                if e.args[0] != ER.DUP_ENTRY:
+                    raise
+                raise HTTPException(status_code=400, detail=f"Un arbre existe déjà à la position {tree_update.position}")
+        
+        # Read back the scalar columns only: photos are untouched by an update
+        await cursor.execute(f"SELECT {TREE_LIST_COLUMNS}, notes FROM trees WHERE id = %s", (tree_id,))
+        tree = await cursor.fetchone()
+        if not tree:
             raise HTTPException(status_code=404, detail="Arbre non trouvé")
         
-        updates = []
-        values = []
-        
-        if tree_update.position is not None:
-            updates.append("position = %s")
-            values.append(tree_update.position)
-        if tree_update.species is not None:
-            updates.append("species = %s")
-            values.append(tree_update.species)
-        if tree_update.variety is not None:
-            updates.append("variety = %s")
-            values.append(tree_update.variety)
-        if tree_update.plant_date is not None:
-            updates.append("plant_date = %s")
-            values.append(tree_update.plant_date)
-        if tree_update.health is not None:
-            updates.append("health = %s")
-            values.append(tree_update.health)
-        if tree_update.notes is not None:
-            updates.append("notes = %s")
-            values.append(tree_update.notes)
-        if tree_update.photo is not None:
-            updates.append("photo = %s")
-            values.append(tree_update.photo)
-        if tree_update.origin is not None:
-            updates.append("origin = %s")
-            values.append(tree_update.origin)
-        if tree_update.gps_coords is not None:
-            updates.append("gps_latitude = %s")
-            updates.append("gps_longitude = %s")
-            values.append(tree_update.gps_coords.latitude)
-            values.append(tree_update.gps_coords.longitude)
-        if tree_update.synced is not None:
-            updates.append("synced = %s")
-            values.append(tree_update.synced)
-        
-        if updates:
-            updates.append("updated_at = %s")
-            values.append(datetime.utcnow())
-            values.append(tree_id)
-            
-            cursor.execute(f"UPDATE trees SET {', '.join(updates)} WHERE id = %s", values)
-        
-        result = get_tree(tree_id)
+        result = format_tree_summary(tree)
+        del result["photo_ids"]
+        result["notes"] = tree["notes"]
         result["message"] = "Arbre modifié avec succès"
         return result
 
 @app.delete("/api/trees/{tree_id}")
-def delete_tree(tree_id: str):
-    with get_db() as conn:
-        cursor = conn.cursor()
+async def delete_tree(tree_id: str):
+    async with get_db(invalidates=("trees", "interventions", "statistics")) as conn:
+        cursor = await conn.cursor()
         
-        cursor.execute("SELECT id FROM trees WHERE id = %s", (tree_id,))
-        if not cursor.fetchone():
+        await cursor.execute("DELETE FROM trees WHERE id = %s", (tree_id,))
+        if cursor.rowcount == 0:
             raise HTTPException(status_code=404, detail="Arbre non trouvé")
         
-        cursor.execute("DELETE FROM trees WHERE id = %s", (tree_id,))
-        
         return {"message": "Arbre supprimé avec succès", "success": True}
 
 # ============== DUPLICATE TREE ==============
 
 @app.post("/api/trees/duplicate")
-def duplicate_tree(data: DuplicateTree):
-    with get_db() as conn:
-        cursor = conn.cursor()
+async def duplicate_tree(data: DuplicateTree):
+    async with get_db(invalidates=("trees", "statistics")) as conn:
+        cursor = await conn.cursor()
         
-        cursor.execute("SELECT * FROM trees WHERE id = %s", (data.source_tree_id,))
-        source = cursor.fetchone()
+        await cursor.execute(
+            "SELECT farm_id, position, species, variety, origin FROM trees WHERE id = %s", (data.source_tree_id,)
+        )
+        source = await cursor.fetchone()
         
         if not source:
             raise HTTPException(status_code=404, detail="Arbre source non trouvé")
         
         target_farm_id = data.target_farm_id or source["farm_id"]
         
-        cursor.execute(
-            "SELECT id FROM trees WHERE farm_id = %s AND position = %s",
-            (target_farm_id, data.target_position)
-        )
-        if cursor.fetchone():
-            raise HTTPException(status_code=400, detail=f"La position {data.target_position} est déjà occupée")
-        
         tree_id = generate_id()
         now = datetime.utcnow()
         
-        cursor.execute("""
-            INSERT INTO trees (id, farm_id, position, species, variety, plant_date, health, notes, origin, synced, created_at, updated_at)
-            VALUES (%s, %s, %s, %s, %s, %s, 'good', %s, %s, TRUE, %s, %s)
-        """, (tree_id, target_farm_id, data.target_position, source["species"], source["variety"], 
-              now.date(), f"Dupliqué de {source['position']}", source["origin"], now, now))
+        try:
+            await cursor.execute("""
+                INSERT INTO trees (id, farm_id, position, species, variety, plant_date, health, notes, origin, synced, created_at, updated_at)
+                VALUES (%s, %s, %s, %s, %s, %s, 'good', %s, %s, TRUE, %s, %s)
+            """, (tree_id, target_farm_id, data.target_position, source["species"], source["variety"], 
+                  now.date(), f"Dupliqué de {source['position']}", source["origin"], now, now))
+        except aiomysql.IntegrityError as e:
+            if e.args[0] != ER.DUP_ENTRY:
+                raise
+            raise HTTPException(status_code=400, detail=f"La position {data.target_position} est déjà occupée")
         
         return {
             "id": tree_id,
@@ -542,31 +839,34 @@ def duplicate_tree(data: DuplicateTree):
             "notes": f"Dupliqué de {source['position']}",
             "origin": source["origin"],
             "photos": [],
+            "photo_ids": [],
             "synced": True,
-            "created_at": now.isoformat(),
-            "updated_at": now.isoformat(),
+            "created_at": now,
+            "updated_at": now,
             "message": "Arbre dupliqué avec succès"
         }
 
 # ============== INTERVENTION ENDPOINTS ==============
 
 @app.post("/api/interventions")
-def create_intervention(intervention: Intervention):
-    with get_db() as conn:
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT id FROM trees WHERE id = %s", (intervention.tree_id,))
-        if not cursor.fetchone():
-            raise HTTPException(status_code=404, detail="Arbre non trouvé")
+async def create_intervention(intervention: Intervention):
+    async with get_db(invalidates=("interventions", "statistics")) as conn:
+        cursor = await conn.cursor()
         
         int_id = generate_id()
-        int_date = intervention.date or datetime.utcnow().isoformat()
         now = datetime.utcnow()
-        
-        cursor.execute("""
-            INSERT INTO interventions (id, tree_id, type, notes, date, created_at)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        """, (int_id, intervention.tree_id, intervention.type, intervention.notes, int_date, now))
+        int_date = intervention.date or now
+        
+        try:
+            await cursor.execute("""
+                INSERT INTO interventions (id, tree_id, type, notes, date, created_at)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, (int_id, intervention.tree_id, intervention.type, intervention.notes, int_date, now))
+        except aiomysql.IntegrityError as e:
+            # The tree_id foreign key rejects interventions on unknown trees
+            if e.args[0] != ER.NO_REFERENCED_ROW_2:
+                raise
+            raise HTTPException(status_code=404, detail="Arbre non trouvé")
         
         return {
             "id": int_id,
@@ -574,110 +874,162 @@ def create_intervention(intervention: Intervention):
             "type": intervention.type,
             "notes": intervention.notes,
             "date": int_date,
-            "created_at": now.isoformat(),
+            "created_at": now,
             "message": "Intervention ajoutée avec succès"
         }
 
+INTERVENTION_COLUMNS = "id, tree_id, type, notes, date, created_at"
+
 @app.get("/api/interventions")
-def get_interventions(tree_id: Optional[str] = None):
-    with get_db() as conn:
-        cursor = conn.cursor()
+@cache(namespace="interventions")
+async def get_interventions(tree_id: Optional[str] = None):
+    async with get_db() as conn:
+        cursor = await conn.cursor()
         
         if tree_id:
-            cursor.execute("SELECT * FROM interventions WHERE tree_id = %s ORDER BY date DESC", (tree_id,))
+            await cursor.execute(f"SELECT {INTERVENTION_COLUMNS} FROM interventions WHERE tree_id = %s ORDER BY date DESC", (tree_id,))
         else:
-            cursor.execute("SELECT * FROM interventions ORDER BY date DESC")
+            await cursor.execute(f"SELECT {INTERVENTION_COLUMNS} FROM interventions ORDER BY date DESC")
         
-        interventions = cursor.fetchall()
+        interventions = await cursor.fetchall()
         
         return [{
             "id": i["id"],
             "tree_id": i["tree_id"],
             "type": i["type"],
             "notes": i["notes"],
-            "date": i["date"].isoformat() if i["date"] else None,
-            "created_at": i["created_at"].isoformat() if i["created_at"] else None
+            "date": i["date"],
+            "created_at": i["created_at"]
         } for i in interventions]
 
 @app.delete("/api/interventions/{intervention_id}")
-def delete_intervention(intervention_id: str):
-    with get_db() as conn:
-        cursor = conn.cursor()
+async def delete_intervention(intervention_id: str):
+    async with get_db(invalidates=("interventions", "statistics")) as conn:
+        cursor = await conn.cursor()
         
-        cursor.execute("SELECT id FROM interventions WHERE id = %s", (intervention_id,))
-        if not cursor.fetchone():
+        await cursor.execute("DELETE FROM interventions WHERE id = %s", (intervention_id,))
+        if cursor.rowcount == 0:
             raise HTTPException(status_code=404, detail="Intervention non trouvée")
         
-        cursor.execute("DELETE FROM interventions WHERE id = %s", (intervention_id,))
-        
         return {"message": "Intervention supprimée avec succès", "success": True}
 
 # ============== PHOTO ENDPOINTS ==============
 
 @app.post("/api/trees/{tree_id}/photos")
-def add_photo(tree_id: str, photo_data: dict):
-    with get_db() as conn:
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT id FROM trees WHERE id = %s", (tree_id,))
-        if not cursor.fetchone():
-            raise HTTPException(status_code=404, detail="Arbre non trouvé")
+async def add_photo(tree_id: str, photo_data: dict):
+    async with get_db(invalidates=("trees",)) as conn:
+        cursor = await conn.cursor()
         
+        statements = []
+        params = []
+        photo_id = None
         if photo_data.get("photo"):
+            now = datetime.utcnow()
             photo_id = generate_id()
-            cursor.execute(
-                "INSERT INTO tree_photos (id, tree_id, photo) VALUES (%s, %s, %s)",
-                (photo_id, tree_id, photo_data["photo"])
-            )
             
-            # Update main photo
-            cursor.execute(
-                "UPDATE trees SET photo = %s, updated_at = %s WHERE id = %s",
-                (photo_data["photo"], datetime.utcnow(), tree_id)
-            )
+            # Store the new photo, then copy it server-side as the main photo so the base64 is sent once
+            statements += [
+                "INSERT INTO tree_photos (id, tree_id, photo, created_at) VALUES (%s, %s, %s, %s)",
+                "UPDATE trees SET photo = (SELECT photo FROM tree_photos WHERE id = %s), updated_at = %s WHERE id = %s",
+            ]
+            params += [photo_id, tree_id, photo_data["photo"], now, photo_id, now, tree_id]
+        
+        # No row here means the tree does not exist
+        statements.append("SELECT (SELECT COUNT(*) FROM tree_photos WHERE tree_id = t.id) AS count FROM trees t WHERE t.id = %s")
+        params.append(tree_id)
+        
+        # Sent as one multi-statement query: a single round trip for the whole upload
+        try:
+            await cursor.execute(";\n".join(statements), params)
+            while await cursor.nextset():
+                pass
+        except aiomysql.IntegrityError as e:
+            if e.args[0] != ER.NO_REFERENCED_ROW_2:
+                raise
+            raise HTTPException(status_code=404, detail="Arbre non trouvé")
         
-        cursor.execute("SELECT COUNT(*) as count FROM tree_photos WHERE tree_id = %s", (tree_id,))
-        count = cursor.fetchone()["count"]
+        tree = await cursor.fetchone()
+        if not tree:
+            raise HTTPException(status_code=404, detail="Arbre non trouvé")
+        count = tree["count"]
         
-        return {"message": "Photo ajoutée avec succès", "photo_count": count, "success": True}
+        return {"message": "Photo ajoutée avec succès", "photo_id": photo_id, "photo_count": count, "success": True}
 
 @app.delete("/api/trees/{tree_id}/photos/{photo_index}")
-def delete_photo(tree_id: str, photo_index: int):
-    with get_db() as conn:
-        cursor = conn.cursor()
+async def delete_photo(tree_id: str, photo_index: int):
+    async with get_db(invalidates=("trees",)) as conn:
+        cursor = await conn.cursor()
         
-        cursor.execute("SELECT id FROM tree_photos WHERE tree_id = %s ORDER BY created_at", (tree_id,))
-        photos = cursor.fetchall()
+        if photo_index < 0:
+            raise HTTPException(status_code=400, detail="Index de photo invalide")
         
-        if photo_index < 0 or photo_index >= len(photos):
+        # Only the targeted row, along with the tree's photo count
+        await cursor.execute("""
+            SELECT id, (SELECT COUNT(*) FROM tree_photos WHERE tree_id = %s) AS count
+            FROM tree_photos WHERE tree_id = %s
+            ORDER BY created_at LIMIT %s, 1
+        """, (tree_id, tree_id, photo_index))
+        photo = await cursor.fetchone()
+        
+        if not photo:
             raise HTTPException(status_code=400, detail="Index de photo invalide")
         
-        photo_id = photos[photo_index]["id"]
-        cursor.execute("DELETE FROM tree_photos WHERE id = %s", (photo_id,))
+        await cursor.execute("DELETE FROM tree_photos WHERE id = %s", (photo["id"],))
         
-        # Update main photo
-        cursor.execute("SELECT photo FROM tree_photos WHERE tree_id = %s ORDER BY created_at DESC LIMIT 1", (tree_id,))
-        last_photo = cursor.fetchone()
-        cursor.execute(
-            "UPDATE trees SET photo = %s, updated_at = %s WHERE id = %s",
-            (last_photo["photo"] if last_photo else None, datetime.utcnow(), tree_id)
-        )
+        # Update main photo without shipping the remaining blob through the app
+        await cursor.execute("""
+            UPDATE trees SET updated_at = %s,
+                photo = (SELECT photo FROM tree_photos WHERE tree_id = %s ORDER BY created_at DESC LIMIT 1)
+            WHERE id = %s
+        """, (datetime.utcnow(), tree_id, tree_id))
         
-        return {"message": "Photo supprimée avec succès", "photo_count": len(photos) - 1, "success": True}
+        return {"message": "Photo supprimée avec succès", "photo_count": photo["count"] - 1, "success": True}
+
+def decode_photo(photo: str):
+    """Split a stored data URI photo into its media type and raw bytes"""
+    header, _, payload = photo.partition(",")
+    if not payload:
+        return "image/jpeg", base64.b64decode(header)
+    media_type = header[len("data:"):].split(";")[0] if header.startswith("data:") else ""
+    return media_type or "image/jpeg", base64.b64decode(payload)
+
+@app.get("/api/photos/{photo_id}")
+async def get_photo(photo_id: str):
+    async with get_db() as conn:
+        cursor = await conn.cursor()
+        await cursor.execute("SELECT photo FROM tree_photos WHERE id = %s", (photo_id,))
+        photo = await cursor.fetchone()
+        
+        if not photo:
+            raise HTTPException(status_code=404, detail="Photo non trouvée")
+        
+        try:
+            media_type, content = decode_photo(photo["photo"])
+        except ValueError:
+            # Photos are stored as sent by clients; binascii.Error is a ValueError
+            logger.warning("Photo %s illisible : base64 invalide", photo_id)
+            raise HTTPException(status_code=422, detail="Photo illisible")
+        
+        # A photo id always refers to the same bytes, so clients may keep it forever.
+        # Images are already compressed: an explicit encoding makes GZipMiddleware skip them
+        return Response(content=content, media_type=media_type,
+                        headers={"Cache-Control": "public, max-age=31536000, immutable",
+                                 "Content-Encoding": "identity"})
 
 # ============== SEARCH ENDPOINT ==============
 
 @app.get("/api/search")
-def search_trees(
+@cache(namespace="trees")
+async def search_trees(
     farm_id: Optional[str] = None,
     query: Optional[str] = None,
     health: Optional[str] = None,
     species: Optional[str] = None
 ):
-    with get_db() as conn:
-        cursor = conn.cursor()
+    async with get_db() as conn:
+        cursor = await conn.cursor()
         
-        sql = "SELECT * FROM trees WHERE 1=1"
+        sql = f"SELECT {TREE_LIST_COLUMNS} FROM trees WHERE 1=1"
         params = []
         
         if farm_id:
@@ -690,35 +1042,33 @@ def search_trees(
         
         if species:
             sql += " AND species LIKE %s"
-            params.append(f"%{species}%")
+            params.append(like_pattern(species))
         
         if query:
-            sql += " AND (species LIKE %s OR variety LIKE %s OR position LIKE %s OR notes LIKE %s)"
-            params.extend([f"%{query}%"] * 4)
-        
-        cursor.execute(sql, params)
-        trees = cursor.fetchall()
-        
-        result = []
-        for tree in trees:
-            cursor.execute("SELECT photo FROM tree_photos WHERE tree_id = %s", (tree["id"],))
-            photos = [p["photo"] for p in cursor.fetchall()]
-            result.append(format_tree(tree, photos))
-        
-        return result
+            match = fulltext_query(query)
+            if match:
+                sql += " AND MATCH(species, variety, position, notes) AGAINST (%s IN BOOLEAN MODE)"
+                params.append(match)
+            else:
+                sql += " AND (species LIKE %s OR variety LIKE %s OR position LIKE %s OR notes LIKE %s)"
+                params.extend([like_pattern(query)] * 4)
+        
+        await cursor.execute(sql, params)
+        trees = await cursor.fetchall()
+        
+        photo_ids = await fetch_photo_ids(cursor, trees)
+        return [format_tree_summary(tree, photo_ids[tree["id"]]) for tree in trees]
 
 # ============== STATISTICS ENDPOINT ==============
 
 @app.get("/api/statistics/{farm_id}")
-def get_statistics(farm_id: str):
-    with get_db() as conn:
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM trees WHERE farm_id = %s", (farm_id,))
-        trees = cursor.fetchall()
+@cache(namespace="statistics")
+async def get_statistics(farm_id: str):
+    async with get_db() as conn:
+        cursor = await conn.cursor()
         
         stats = {
-            "total": len(trees),
+            "total": 0,
             "good": 0, "fair": 0, "poor": 0, "dead": 0,
             "species_count": {},
             "recent_plantings": 0,
@@ -726,164 +1076,334 @@ def get_statistics(farm_id: str):
             "interventions_by_type": {}
         }
         
-        tree_ids = [t["id"] for t in trees]
-        
-        for tree in trees:
-            health = tree.get("health", "good")
-            stats[health] = stats.get(health, 0) + 1
-            
-            species = tree.get("species", "Unknown")
-            stats["species_count"][species] = stats["species_count"].get(species, 0) + 1
-            
-            plant_date = tree.get("plant_date")
-            if plant_date:
-                try:
-                    if hasattr(plant_date, 'date'):
-                        plant_date = plant_date
-                    else:
-                        plant_date = datetime.fromisoformat(str(plant_date).replace('Z', ''))
-                    days_diff = (datetime.now() - datetime.combine(plant_date, datetime.min.time())).days
-                    if days_diff <= 30:
-                        stats["recent_plantings"] += 1
-                except:
-                    pass
-        
-        if tree_ids:
-            placeholders = ','.join(['%s'] * len(tree_ids))
-            cursor.execute(f"SELECT type, COUNT(*) as count FROM interventions WHERE tree_id IN ({placeholders}) GROUP BY type", tree_ids)
-            for row in cursor.fetchall():
-                stats["interventions_by_type"][row["type"]] = row["count"]
-                stats["total_interventions"] += row["count"]
+        # MySQL tallies the trees: one row per (health, species) group
+        cutoff = date.today() - timedelta(days=30)
+        await cursor.execute("""
+            SELECT health, species, COUNT(*) AS count, SUM(plant_date >= %s) AS recent
+            FROM trees WHERE farm_id = %s
+            GROUP BY health, species
+        """, (cutoff, farm_id))
+        health_count = Counter()
+        species_count = Counter()
+        for row in await cursor.fetchall():
+            health_count[row["health"]] += row["count"]
+            species_count[row["species"]] += row["count"]
+            stats["recent_plantings"] += int(row["recent"] or 0)
+        stats["total"] = sum(health_count.values())
+        stats.update(health_count)
+        stats["species_count"] = dict(species_count)
+        
+        await cursor.execute("""
+            SELECT i.type, COUNT(*) AS count
+            FROM interventions i JOIN trees t ON t.id = i.tree_id
+            WHERE t.farm_id = %s
+            GROUP BY i.type
+        """, (farm_id,))
+        for row in await cursor.fetchall():
+            stats["interventions_by_type"][row["type"]] = row["count"]
+            stats["total_interventions"] += row["count"]
         
         return stats
 
 # ============== EXPORT/IMPORT ENDPOINTS ==============
 
+EXPORT_BATCH_SIZE = 500
+
+def format_export_farm(f):
+    gps = None
+    if f.get("gps_latitude") and f.get("gps_longitude"):
+        gps = {"latitude": f["gps_latitude"], "longitude": f["gps_longitude"]}
+    return {
+        "id": f["id"], "name": f["name"], "description": f["description"],
+        "grid_rows": f["grid_rows"], "grid_cols": f["grid_cols"],
+        "gps_coords": gps,
+        "created_at": f["created_at"]
+    }
+
+def format_export_intervention(i):
+    return {
+        "id": i["id"], "tree_id": i["tree_id"], "type": i["type"],
+        "notes": i["notes"], "date": i["date"]
+    }
+
+def export_queries(farm_id):
+    """(record type, SQL, params, formatter) for each exported table"""
+    if farm_id:
+        return [
+            ("farm", "SELECT * FROM farms WHERE id = %s", (farm_id,), format_export_farm),
+            ("tree", "SELECT * FROM trees WHERE farm_id = %s", (farm_id,), format_tree),
+            ("intervention", """
+                SELECT i.* FROM interventions i JOIN trees t ON t.id = i.tree_id
+                WHERE t.farm_id = %s
+            """, (farm_id,), format_export_intervention),
+        ]
+    return [
+        ("farm", "SELECT * FROM farms", (), format_export_farm),
+        ("tree", "SELECT * FROM trees", (), format_tree),
+        ("intervention", "SELECT * FROM interventions", (), format_export_intervention),
+    ]
+
+async def fetch_batches(conn, sql, params):
+    """Yield the rows of ``sql`` in batches from an unbuffered server-side cursor"""
+    cursor = await conn.cursor(aiomysql.SSDictCursor)
+    try:
+        await cursor.execute(sql, params)
+        while True:
+            rows = await cursor.fetchmany(EXPORT_BATCH_SIZE)
+            if not rows:
+                break
+            yield rows
+    finally:
+        await cursor.close()
+
+async def export_ndjson(conn, farm_id):
+    """One JSON record per line, read from the database as it is sent"""
+    async with get_db(conn=conn):
+        yield dumps_json({"type": "export", "export_date": datetime.utcnow()}) + b"\n"
+        for record_type, sql, params, formatter in export_queries(farm_id):
+            async for rows in fetch_batches(conn, sql, params):
+                yield b"".join(dumps_json({"type": record_type, "data": formatter(row)}) + b"\n" for row in rows)
+
+async def export_json(conn, farm_id):
+    """The export document, written out array by array as rows are read"""
+    async with get_db(conn=conn):
+        yield b'{"export_date":' + dumps_json(datetime.utcnow())
+        for record_type, sql, params, formatter in export_queries(farm_id):
+            yield f',"{record_type}s":['.encode()
+            separator = b""
+            async for rows in fetch_batches(conn, sql, params):
+                yield separator + b",".join(dumps_json(formatter(row)) for row in rows)
+                separator = b","
+            yield b"]"
+        yield b"}"
+
 @app.get("/api/export")
-def export_data(farm_id: Optional[str] = None):
-    with get_db() as conn:
-        cursor = conn.cursor()
-        
-        if farm_id:
-            cursor.execute("SELECT * FROM farms WHERE id = %s", (farm_id,))
-        else:
-            cursor.execute("SELECT * FROM farms")
-        farms = cursor.fetchall()
-        
-        if farm_id:
-            cursor.execute("SELECT * FROM trees WHERE farm_id = %s", (farm_id,))
-        else:
-            cursor.execute("SELECT * FROM trees")
-        trees = cursor.fetchall()
-        
-        tree_ids = [t["id"] for t in trees]
-        interventions = []
-        if tree_ids:
-            placeholders = ','.join(['%s'] * len(tree_ids))
-            cursor.execute(f"SELECT * FROM interventions WHERE tree_id IN ({placeholders})", tree_ids)
-            interventions = cursor.fetchall()
-        
-        # Format data
-        farms_data = []
-        for f in farms:
-            gps = None
-            if f.get("gps_latitude") and f.get("gps_longitude"):
-                gps = {"latitude": f["gps_latitude"], "longitude": f["gps_longitude"]}
-            farms_data.append({
-                "id": f["id"], "name": f["name"], "description": f["description"],
-                "grid_rows": f["grid_rows"], "grid_cols": f["grid_cols"],
-                "gps_coords": gps,
-                "created_at": f["created_at"].isoformat() if f["created_at"] else None
-            })
-        
-        trees_data = [format_tree(t) for t in trees]
-        
-        int_data = [{
-            "id": i["id"], "tree_id": i["tree_id"], "type": i["type"],
-            "notes": i["notes"], "date": i["date"].isoformat() if i["date"] else None
-        } for i in interventions]
-        
-        return {
-            "export_date": datetime.utcnow().isoformat(),
-            "farms": farms_data,
-            "trees": trees_data,
-            "interventions": int_data
-        }
+async def export_data(farm_id: Optional[str] = None, output: str = Query("json", alias="format", pattern="^(json|ndjson)$")):
+    # Acquired before the response starts, so a saturated pool still answers 503;
+    # the stream releases the connection once it is done
+    conn = await acquire_db()
+    if output == "ndjson":
+        return StreamingResponse(export_ndjson(conn, farm_id), media_type="application/x-ndjson")
+    return StreamingResponse(export_json(conn, farm_id), media_type="application/json")
+
+# Rows per multi-row INSERT and per commit while streaming an import
+IMPORT_BATCH_ROWS = 1000
+
+# Bulk write statements. Only %s placeholders in VALUES, so that executemany
+# sends each batch as one multi-row statement that the server parses once
+INSERT_FARM_SQL = """
+    INSERT IGNORE INTO farms (id, name, description, grid_rows, grid_cols, gps_latitude, gps_longitude)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+"""
+INSERT_TREE_SQL = """
+    INSERT IGNORE INTO trees (id, farm_id, position, species, variety, plant_date, health, notes, origin, gps_latitude, gps_longitude)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
+INSERT_INTERV_SQL = """
+    INSERT IGNORE INTO interventions (id, tree_id, type, notes, date)
+    VALUES (%s, %s, %s, %s, %s)
+"""
+# Sync writes: a plain INSERT for new trees lets a taken farm position fail that
+# record instead of overwriting the tree already there
+SYNC_INSERT_TREE_SQL = """
+    INSERT INTO trees (id, farm_id, position, species, variety, plant_date, health, notes, synced, updated_at)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
+# Existing trees go through the same multi-row INSERT with their stored farm_id and
+# position, so the only key they can collide on is their own row
+SYNC_UPDATE_TREE_SQL = SYNC_INSERT_TREE_SQL.rstrip() + """
+    ON DUPLICATE KEY UPDATE species = VALUES(species), variety = VALUES(variety), health = VALUES(health),
+        notes = VALUES(notes), synced = VALUES(synced), updated_at = VALUES(updated_at)
+"""
+
+def import_farm_row(farm):
+    gps = farm.get("gps_coords")
+    return (farm.get("id") or generate_id(), farm["name"], farm.get("description"), farm.get("grid_rows", 20), farm.get("grid_cols", 20),
+            gps["latitude"] if gps else None, gps["longitude"] if gps else None)
+
+def import_tree_row(tree):
+    gps = tree.get("gps_coords")
+    return (tree.get("id") or generate_id(), tree["farm_id"], tree["position"], tree["species"], tree.get("variety"),
+            tree.get("plant_date"), tree.get("health", "good"), tree.get("notes"), tree.get("origin"),
+            gps["latitude"] if gps else None, gps["longitude"] if gps else None)
+
+def import_intervention_row(intervention):
+    return (intervention.get("id") or generate_id(), intervention["tree_id"], intervention["type"],
+            intervention.get("notes"), intervention.get("date"))
+
+# Top-level arrays of an import document: insert statement and row builder
+IMPORT_SECTIONS = {
+    "farms": (INSERT_FARM_SQL, import_farm_row),
+    "trees": (INSERT_TREE_SQL, import_tree_row),
+    "interventions": (INSERT_INTERV_SQL, import_intervention_row),
+}
+IMPORT_ORDER = list(IMPORT_SECTIONS)
+
+class RequestBody:
+    """Async file-like view of a request body, read chunk by chunk by ijson"""
+    
+    def __init__(self, request: Request):
+        self.chunks = request.stream()
+    
+    async def read(self, size=-1):
+        # ijson probes the content type with read(0)
+        if size == 0:
+            return b""
+        return await anext(self.chunks, b"")
+
+async def import_records(request: Request):
+    """Yield (section, record) for each record of the import document as it is parsed"""
+    section = builder = None
+    async for prefix, event, value in ijson.parse_async(RequestBody(request), use_float=True):
+        if builder is None:
+            section = prefix[:-len(".item")] if prefix.endswith(".item") else None
+            if section in IMPORT_SECTIONS and event == "start_map":
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+            continue
+        builder.event(event, value)
+        if prefix == f"{section}.item" and event == "end_map":
+            yield section, builder.value
+            builder = None
+
+def import_failed(status_code, detail, imported):
+    """Error response that still reports the batches committed before the failure"""
+    return ORJSONResponse(status_code=status_code, content={"detail": detail, "imported": imported, "success": False})
 
 @app.post("/api/import")
-def import_data(data: dict):
-    with get_db() as conn:
-        cursor = conn.cursor()
-        imported = {"farms": 0, "trees": 0, "interventions": 0}
-        
-        for farm in data.get("farms", []):
-            farm_id = farm.get("id") or generate_id()
-            gps = farm.get("gps_coords")
-            cursor.execute("""
-                INSERT IGNORE INTO farms (id, name, description, grid_rows, grid_cols, gps_latitude, gps_longitude)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """, (farm_id, farm["name"], farm.get("description"), farm.get("grid_rows", 20), farm.get("grid_cols", 20),
-                  gps["latitude"] if gps else None, gps["longitude"] if gps else None))
-            imported["farms"] += 1
-        
-        for tree in data.get("trees", []):
-            tree_id = tree.get("id") or generate_id()
-            gps = tree.get("gps_coords")
-            cursor.execute("""
-                INSERT IGNORE INTO trees (id, farm_id, position, species, variety, plant_date, health, notes, origin, gps_latitude, gps_longitude)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (tree_id, tree["farm_id"], tree["position"], tree["species"], tree.get("variety"),
-                  tree.get("plant_date"), tree.get("health", "good"), tree.get("notes"), tree.get("origin"),
-                  gps["latitude"] if gps else None, gps["longitude"] if gps else None))
-            imported["trees"] += 1
-        
-        for intervention in data.get("interventions", []):
-            int_id = intervention.get("id") or generate_id()
-            cursor.execute("""
-                INSERT IGNORE INTO interventions (id, tree_id, type, notes, date)
-                VALUES (%s, %s, %s, %s, %s)
-            """, (int_id, intervention["tree_id"], intervention["type"], intervention.get("notes"), intervention.get("date")))
-            imported["interventions"] += 1
-        
-        return {"message": "Import réussi", "imported": imported, "success": True}
+async def import_data(request: Request):
+    imported = {section: 0 for section in IMPORT_SECTIONS}
+    
+    # Each batch commits on its own, so caches are cleared in the finally below
+    # rather than by get_db, which only does it when the whole request succeeds
+    try:
+        async with get_db() as conn:
+            cursor = await conn.cursor()
+            
+            async def flush(section, rows):
+                # Skip records that already exist (re-imported snapshots) with one lookup
+                # instead of letting INSERT IGNORE lock and reject each of them
+                ids = [row[0] for row in rows]
+                await cursor.execute(f"SELECT id FROM {section} WHERE id IN ({', '.join(['%s'] * len(ids))})", ids)
+                existing = {row["id"] for row in await cursor.fetchall()}
+                new_rows = [row for row in rows if row[0] not in existing]
+                
+                # INSERT IGNORE still covers orphans and position conflicts, and makes
+                # re-running a partially committed import safe; rows it drops are not counted
+                inserted = 0
+                if new_rows:
+                    await cursor.executemany(IMPORT_SECTIONS[section][0], new_rows)
+                    inserted = cursor.rowcount
+                await conn.commit()
+                imported[section] += len(rows) - len(new_rows) + inserted
+            
+            # Records are inserted while the body is still being received, so memory
+            # stays bounded by one batch. Sections must come in export order: trees
+            # read before their farms would be dropped as orphans by INSERT IGNORE
+            batch_section, rows = None, []
+            async for section, record in import_records(request):
+                if batch_section and IMPORT_ORDER.index(section) < IMPORT_ORDER.index(batch_section):
+                    return import_failed(400, f"Sections attendues dans l'ordre : {', '.join(IMPORT_ORDER)}", imported)
+                if rows and (section != batch_section or len(rows) >= IMPORT_BATCH_ROWS):
+                    await flush(batch_section, rows)
+                    rows = []
+                batch_section = section
+                try:
+                    rows.append(IMPORT_SECTIONS[section][1](record))
+                except (KeyError, TypeError):
+                    # Missing required field or malformed gps_coords
+                    return import_failed(400, f"Enregistrement invalide dans {section} : {record.get('id') or 'sans id'}", imported)
+            if rows:
+                await flush(batch_section, rows)
+            
+            return {"message": "Import réussi", "imported": imported, "success": True}
+    except ijson.JSONError:
+        return import_failed(400, "Fichier d'import invalide", imported)
+    except aiomysql.MySQLError as e:
+        # Batches already committed stay imported; report them so the client can tell what is left
+        logger.exception("Import interrompu après %s", imported, exc_info=e)
+        status_code = 503 if isinstance(e, aiomysql.OperationalError) else 500
+        return import_failed(status_code, "Import interrompu", imported)
+    finally:
+        if any(imported.values()):
+            for namespace in ALL_CACHE_NAMESPACES:
+                await FastAPICache.clear(namespace=namespace)
 
 # ============== SYNC ENDPOINT ==============
 
+async def execute_batch(cursor, sql, rows, errors):
+    """Run ``sql`` for each (data, params) row in one executemany call
+
+    If the batch fails, rows are replayed one by one so that only the
+    offending ones are reported in ``errors``. Returns the rows that were
+    written.
+    """
+    if not rows:
+        return []
+    # aiomysql splits long batches into several statements: the earlier ones
+    # must be undone before the replay or their rows would fail as duplicates
+    await cursor.execute("SAVEPOINT sync_batch")
+    try:
+        await cursor.executemany(sql, [params for _, params in rows])
+        return rows
+    except aiomysql.MySQLError:
+        await cursor.execute("ROLLBACK TO SAVEPOINT sync_batch")
+        written = []
+        for data, params in rows:
+            try:
+                await cursor.execute(sql, params)
+                written.append((data, params))
+            except aiomysql.MySQLError as e:
+                errors.append({"data": data, "error": str(e)})
+        return written
+
 @app.post("/api/trees/sync")
-def sync_trees(sync_batch: SyncBatch):
-    synced = []
+async def sync_trees(sync_batch: SyncBatch):
     errors = []
     
-    with get_db() as conn:
-        cursor = conn.cursor()
-        
-        for tree_data in sync_batch.trees:
-            try:
-                if tree_data.get("id"):
-                    cursor.execute("SELECT id FROM trees WHERE id = %s", (tree_data["id"],))
-                    if cursor.fetchone():
-                        # Update
-                        cursor.execute("""
-                            UPDATE trees SET species=%s, variety=%s, health=%s, notes=%s, synced=TRUE, updated_at=%s WHERE id=%s
-                        """, (tree_data.get("species"), tree_data.get("variety"), tree_data.get("health"),
-                              tree_data.get("notes"), datetime.utcnow(), tree_data["id"]))
-                        synced.append(tree_data)
-                        continue
-                
-                # Create new
-                tree_id = generate_id()
-                cursor.execute("""
-                    INSERT INTO trees (id, farm_id, position, species, variety, plant_date, health, notes, synced)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, TRUE)
-                """, (tree_id, tree_data["farm_id"], tree_data["position"], tree_data["species"],
-                      tree_data.get("variety"), tree_data.get("plant_date"), tree_data.get("health", "good"),
-                      tree_data.get("notes")))
-                tree_data["id"] = tree_id
-                synced.append(tree_data)
-            except Exception as e:
-                errors.append({"data": tree_data, "error": str(e)})
+    async with get_db(invalidates=("trees", "statistics")) as conn:
+        cursor = await conn.cursor()
+        
+        # Trees pointing at unknown farms are reported up front, so the batch only
+        # fails in exceptional cases and the common path has no per-row handling
+        farm_ids = list({tree.farm_id for tree in sync_batch.trees})
+        valid_farms = set()
+        if farm_ids:
+            await cursor.execute(f"SELECT id FROM farms WHERE id IN ({', '.join(['%s'] * len(farm_ids))})", farm_ids)
+            valid_farms = {row["id"] for row in await cursor.fetchall()}
+        
+        # Resolve which incoming trees already exist, and where, with a single query
+        ids = list({tree.id for tree in sync_batch.trees if tree.id})
+        existing = {}
+        if ids:
+            await cursor.execute(f"SELECT id, farm_id, position FROM trees WHERE id IN ({', '.join(['%s'] * len(ids))})", ids)
+            existing = {row["id"]: row for row in await cursor.fetchall()}
+        
+        # One timestamp for the whole batch
+        now = datetime.utcnow()
+        update_rows = []
+        insert_rows = []
+        for tree in sync_batch.trees:
+            stored = existing.get(tree.id)
+            if stored:
+                update_rows.append((tree, (tree.id, stored["farm_id"], stored["position"], tree.species, tree.variety,
+                                           tree.plant_date, tree.health, tree.notes, True, now)))
+                continue
+            if tree.farm_id not in valid_farms:
+                errors.append({"data": tree, "error": "Ferme non trouvée"})
+                continue
+            tree_id = tree.id or generate_id()
+            insert_rows.append((tree, (tree_id, tree.farm_id, tree.position, tree.species, tree.variety,
+                                       tree.plant_date, tree.health, tree.notes, True, now)))
+        
+        # Ids are read back from the rows actually written, so a generated id is
+        # only reported once its INSERT went through
+        updated = await execute_batch(cursor, SYNC_UPDATE_TREE_SQL, update_rows, errors)
+        inserted = await execute_batch(cursor, SYNC_INSERT_TREE_SQL, insert_rows, errors)
+        synced_ids = [params[0] for _, params in updated + inserted]
     
-    return {"synced_count": len(synced), "error_count": len(errors), "synced_trees": synced, "errors": errors}
+    # Ids only: echoing every synced record back would double the payload
+    return {"synced_count": len(synced_ids), "error_count": len(errors), "synced_ids": synced_ids, "errors": errors}
 
 if __name__ == "__main__":
     import uvicorn